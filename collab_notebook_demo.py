@@ -1,15 +1,25 @@
 # backend/app/main.py
-import json
-import re
+import asyncio
+import base64
+import hashlib
+import random
 import sqlite3
 import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from pathlib import Path
 from typing import Dict, Any
 
+import aiosqlite
+import orjson
+from aiosqlitepool import SQLiteConnectionPool
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import Body
-from pydantic import BaseModel
+from fastapi.responses import Response
+from fastapi import Body, Query
+from pydantic import BaseModel, Field
 import socketio
+import zstandard as zstd
 from jose import jwt
 from passlib.context import CryptContext
 import os
@@ -20,10 +30,45 @@ JWT_ALG = "HS256"
 
 # --- Database (SQLite simple) ---
 DB_PATH = os.environ.get("DEMO_DB", "demo.db")
+# JSON columns are stored as JSONB where SQLite supports it (>= 3.45), else as minified JSON text
+JSON_STORE = "jsonb" if sqlite3.sqlite_version_info >= (3, 45, 0) else "json"
+
+# Hot statements, kept as fixed SQL text: sqlite3 caches compiled statements per
+# connection (LRU, 128 by default) keyed by that text, so pooled connections prepare
+# each of these once
+SQL_USER_PASSWORD = "SELECT password_hash FROM users WHERE username = ?"
+SQL_GET_NOTEBOOK = "SELECT id, title, CASE content_enc WHEN 'zstd' THEN content ELSE json(content) END, content_enc, owner, created_at, updated_at FROM notebooks WHERE id = ?"
+_CONTENT_IN = f"CASE :enc WHEN 'zstd' THEN :content ELSE {JSON_STORE}(:content) END"
+SQL_UPDATE_NOTEBOOK = f"UPDATE notebooks SET title=:title, content={_CONTENT_IN}, content_enc=:enc, tag=:tag, updated_at=:ts WHERE id=:id"
+SQL_INSERT_NOTEBOOK = f"INSERT INTO notebooks (title, content, content_enc, tag, owner, created_at, updated_at) VALUES (:title, {_CONTENT_IN}, :enc, :tag, :owner, :ts, :ts)"
+# audit details are only read back through /query, so they stay plain JSON text
+SQL_INSERT_AUDIT = "INSERT INTO audit (notebook_id, action, who, ts, details) VALUES (?, ?, ?, ?, json(?))"
+
+# Notebook content above this size is stored zstd-compressed (content_enc='zstd') as an
+# opaque BLOB; smaller content stays JSON so it costs nothing extra to read
+COMPRESS_MIN_BYTES = 4096
+_zstd_compressor = zstd.ZstdCompressor(level=3)
+_zstd_decompressor = zstd.ZstdDecompressor()
+
+def encode_content(content: Dict[str, Any]) -> tuple[str | bytes, str]:
+    blob = orjson.dumps(content)
+    if len(blob) > COMPRESS_MIN_BYTES:
+        return _zstd_compressor.compress(blob), "zstd"
+    return blob.decode(), "raw"
+
+def decode_content(content: str | bytes, enc: str) -> Any:
+    return orjson.loads(_zstd_decompressor.decompress(content) if enc == "zstd" else content)
 
 def init_db():
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
+    # incremental auto-vacuum lets background_optimize hand free pages back in small batches;
+    # files created without it need one VACUUM to switch modes
+    cur.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    if cur.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        cur.execute("VACUUM")
+    # persistent in the database file; WAL lets readers proceed alongside a writer
+    cur.execute("PRAGMA journal_mode=WAL")
     cur.execute("""
     CREATE TABLE IF NOT EXISTS users (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -36,6 +81,8 @@ def init_db():
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         title TEXT,
         content TEXT,
+        content_enc TEXT NOT NULL DEFAULT 'raw',
+        tag TEXT,
         owner INTEGER,
         created_at REAL,
         updated_at REAL
@@ -51,44 +98,178 @@ def init_db():
         details TEXT
     )
     """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_notebooks_updated ON notebooks(updated_at DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_notebooks_owner ON notebooks(owner)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_audit_nb_ts ON audit(notebook_id, ts DESC)")
+    # older files predate these columns; CREATE TABLE IF NOT EXISTS won't add them
+    columns = {r[1] for r in cur.execute("PRAGMA table_info(notebooks)")}
+    if "content_enc" not in columns:
+        cur.execute("ALTER TABLE notebooks ADD COLUMN content_enc TEXT NOT NULL DEFAULT 'raw'")
+    if "tag" not in columns:
+        cur.execute("ALTER TABLE notebooks ADD COLUMN tag TEXT")
+        cur.execute("UPDATE notebooks SET tag = json_extract(content, '$.tag') WHERE json_type(content, '$.tag') = 'text'")
+    # compressed content is opaque to JSON1, so the tag lives in its own indexed column
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_notebooks_tag ON notebooks(tag)")
+    # --- Demo: create an admin user if not exists (only hashes when it is missing) ---
+    if cur.execute("SELECT 1 FROM users WHERE username = ?", ("demo",)).fetchone() is None:
+        cur.execute("INSERT INTO users (username, password_hash) VALUES (?, ?) ON CONFLICT(username) DO NOTHING",
+                    ("demo", pwd_context.hash("demo")))
     conn.commit()
+    # refresh planner stats once at startup so the indexes above get picked
+    cur.execute("ANALYZE")
     conn.close()
 
-init_db()
-
 # --- Simple user utils (demo) ---
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-def create_user(username: str, password: str):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    ph = pwd_context.hash(password)
-    try:
-        cur.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, ph))
-        conn.commit()
-    except Exception as e:
-        conn.close()
-        raise
-    conn.close()
-
-def authenticate_user(username: str, password: str):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT password_hash FROM users WHERE username = ?", (username,))
-    row = cur.fetchone()
-    conn.close()
+# bcrypt is deliberately slow; verify runs on the default executor, not the event loop
+async def authenticate_user(username: str, password: str):
+    async with ro_pool.connection() as conn:
+        cur = await conn.execute(SQL_USER_PASSWORD, (username,))
+        row = await cur.fetchone()
     if not row:
         return False
-    return pwd_context.verify(password, row[0])
+    return await asyncio.get_running_loop().run_in_executor(None, pwd_context.verify, password, row[0])
 
 def build_token(username: str):
     payload = {"sub": username, "iat": int(time.time())}
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALG)
 
+# Bounded LRU of verified tokens: sha256(token) -> (sub, valid_until)
+JWT_CACHE_MAX = 10_000
+JWT_CACHE_TTL = 5  # seconds, for tokens without an exp claim
+_jwt_cache: OrderedDict[bytes, tuple[str, float]] = OrderedDict()
+
+def token_subject(token: str) -> str:
+    """Return the token's `sub`, skipping signature checks for recently verified tokens."""
+    key = hashlib.sha256(token.encode()).digest()
+    now = time.time()
+    hit = _jwt_cache.get(key)
+    if hit is not None:
+        if hit[1] > now:
+            _jwt_cache.move_to_end(key)
+            return hit[0]
+        del _jwt_cache[key]
+    claims = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
+    _jwt_cache[key] = (claims["sub"], claims.get("exp") or now + JWT_CACHE_TTL)
+    if len(_jwt_cache) > JWT_CACHE_MAX:
+        _jwt_cache.popitem(last=False)
+    return claims["sub"]
+
+
+# --- Connection pools (long-lived, shared across requests) ---
+# Under WAL many readers run alongside one writer, so reads and writes get separate
+# pools: GET endpoints, login and /query never queue behind a saving connection
+RO_POOL_SIZE = 8
+RW_POOL_SIZE = 2
+ro_pool: SQLiteConnectionPool | None = None
+rw_pool: SQLiteConnectionPool | None = None
+
+# Applied once per new pooled connection (journal_mode=WAL is persistent and set in init_db)
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Read-only connections are also sandboxed for /query: query_only plus an authorizer that
+# denies everything except reads, so WITH/comment-prefixed SQL cannot slip a write through
+QUERY_ALLOWED_ACTIONS = frozenset({sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE})
+
+def read_only_authorizer(action, *args):
+    return sqlite3.SQLITE_OK if action in QUERY_ALLOWED_ACTIONS else sqlite3.SQLITE_DENY
+
+async def _open_connection(database: str, **kwargs):
+    conn = await aiosqlite.connect(database, **kwargs)
+    for pragma in CONNECTION_PRAGMAS:
+        await conn.execute(pragma)
+    return conn
+
+async def rw_connection_factory():
+    return await _open_connection(DB_PATH)
+
+async def ro_connection_factory():
+    conn = await _open_connection(f"{Path(DB_PATH).resolve().as_uri()}?mode=ro", uri=True)
+    await conn.execute("PRAGMA query_only=ON")
+    await conn.set_authorizer(read_only_authorizer)
+    return conn
+
+# --- Audit log: written off the request path, batched into one transaction ---
+AUDIT_BATCH_SIZE = 100
+AUDIT_FLUSH_INTERVAL = 0.05  # seconds
+audit_queue: asyncio.Queue | None = None
+
+async def audit_worker():
+    """Drain audit_queue in batches until a None sentinel arrives."""
+    loop = asyncio.get_running_loop()
+    running = True
+    while running:
+        batch = [await audit_queue.get()]
+        deadline = loop.time() + AUDIT_FLUSH_INTERVAL
+        while len(batch) < AUDIT_BATCH_SIZE and batch[-1] is not None:
+            try:
+                batch.append(audit_queue.get_nowait())
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(audit_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        if batch[-1] is None:
+            running = False
+            batch.pop()
+        if not batch:
+            continue
+        try:
+            async with rw_pool.connection() as conn:
+                await conn.executemany(SQL_INSERT_AUDIT, batch)
+                await conn.commit()
+        except Exception as e:
+            print("Audit write failed:", e)
+
+# --- Periodic maintenance: keep planner stats fresh and trim free pages ---
+OPTIMIZE_INTERVAL = 600  # seconds
+
+async def background_optimize():
+    while True:
+        await asyncio.sleep(OPTIMIZE_INTERVAL)
+        try:
+            async with rw_pool.connection() as conn:
+                # executescript steps each pragma to completion; a plain execute() would
+                # stop after the first step and incremental_vacuum would free a single page
+                await conn.executescript("PRAGMA optimize; PRAGMA incremental_vacuum(100);")
+        except Exception as e:
+            print("Background optimize failed:", e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global ro_pool, rw_pool, audit_queue
+    init_db()
+    ro_pool = SQLiteConnectionPool(ro_connection_factory, pool_size=RO_POOL_SIZE)
+    rw_pool = SQLiteConnectionPool(rw_connection_factory, pool_size=RW_POOL_SIZE)
+    audit_queue = asyncio.Queue()
+    audit_task = asyncio.create_task(audit_worker())
+    optimize_task = asyncio.create_task(background_optimize())
+    try:
+        yield
+    finally:
+        # let an in-flight maintenance run unwind before its connection is closed
+        optimize_task.cancel()
+        await asyncio.gather(optimize_task, return_exceptions=True)
+        # flush queued audit rows before the pools go away
+        audit_queue.put_nowait(None)
+        await audit_task
+        await ro_pool.close()
+        await rw_pool.close()
+
 
 # --- FastAPI + Socket.IO setup ---
 sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins="*")
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # for demo; restrict in prod
@@ -98,8 +279,9 @@ app.add_middleware(
 )
 asgi_app = socketio.ASGIApp(sio, other_asgi_app=app)
 
-# Simple in-memory mapping of rooms -> set of connected sids (for presence)
-ROOMS = {}
+# Presence is derived from python-socketio's own room membership (no parallel bookkeeping)
+def room_count(room, exclude=None) -> int:
+    return sum(1 for sid, _ in sio.manager.get_participants("/", room) if sid != exclude)
 
 # --- Models ---
 class Credentials(BaseModel):
@@ -111,92 +293,123 @@ class NotebookSave(BaseModel):
     title: str
     content: Dict[str, Any]
 
-# --- Demo: create an admin user if not exists ---
-try:
-    create_user("demo", "demo")
-except Exception:
-    pass
+# Serialize straight to bytes with orjson; returning a Response skips FastAPI's jsonable_encoder pass
+def json_response(data: Any) -> Response:
+    return Response(orjson.dumps(data), media_type="application/json")
 
 # --- REST endpoints ---
 @app.post("/auth/login")
 async def login(creds: Credentials):
-    ok = authenticate_user(creds.username, creds.password)
+    ok = await authenticate_user(creds.username, creds.password)
     if not ok:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     token = build_token(creds.username)
     return {"access_token": token, "token_type": "bearer"}
 
 @app.get("/notebooks")
-async def list_notebooks():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT id, title, owner, created_at, updated_at FROM notebooks ORDER BY updated_at DESC")
-    rows = cur.fetchall()
-    result = [{"id": r[0], "title": r[1], "owner": r[2], "created_at": r[3], "updated_at": r[4]} for r in rows]
-    conn.close()
-    return result
+async def list_notebooks(tag: str | None = None):
+    async with ro_pool.connection() as conn:
+        if tag is None:
+            cur = await conn.execute("SELECT id, title, owner, created_at, updated_at FROM notebooks ORDER BY updated_at DESC")
+        else:
+            cur = await conn.execute("SELECT id, title, owner, created_at, updated_at FROM notebooks WHERE tag = ? ORDER BY updated_at DESC", (tag,))
+        rows = await cur.fetchall()
+    return json_response([{"id": r[0], "title": r[1], "owner": r[2], "created_at": r[3], "updated_at": r[4]} for r in rows])
 
 @app.get("/notebooks/{nid}")
 async def get_notebook(nid: int):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT id, title, content, owner, created_at, updated_at FROM notebooks WHERE id = ?", (nid,))
-    r = cur.fetchone()
-    conn.close()
+    async with ro_pool.connection() as conn:
+        cur = await conn.execute(SQL_GET_NOTEBOOK, (nid,))
+        r = await cur.fetchone()
     if not r:
         raise HTTPException(status_code=404, detail="Not found")
-    return {"id": r[0], "title": r[1], "content": json.loads(r[2]), "owner": r[3], "created_at": r[4], "updated_at": r[5]}
+    return json_response({"id": r[0], "title": r[1], "content": decode_content(r[2], r[3]), "owner": r[4], "created_at": r[5], "updated_at": r[6]})
 
 @app.post("/notebooks")
 async def save_notebook(payload: NotebookSave, token: str = Body(...)):
     # For demo, token is required but we won't fully validate claims
     username = "unknown"
     try:
-        username = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])["sub"]
+        username = token_subject(token)
     except Exception:
         pass
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
     ts = time.time()
-    if payload.id:
-        cur.execute("UPDATE notebooks SET title=?, content=?, updated_at=? WHERE id=?", (payload.title, json.dumps(payload.content), ts, payload.id))
-        nid = payload.id
-        action = "update"
-    else:
-        cur.execute("INSERT INTO notebooks (title, content, owner, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
-                    (payload.title, json.dumps(payload.content), username, ts, ts))
-        nid = cur.lastrowid
-        action = "create"
-    cur.execute("INSERT INTO audit (notebook_id, action, who, ts, details) VALUES (?, ?, ?, ?, ?)",
-                (nid, action, username, ts, json.dumps({"title": payload.title})))
-    conn.commit()
-    conn.close()
+    try:
+        content, enc = encode_content(payload.content)
+    except orjson.JSONEncodeError as e:
+        # e.g. integers beyond 64 bits, which orjson (and SQLite's JSON1) cannot represent
+        raise HTTPException(status_code=422, detail=f"Unsupported notebook content: {e}")
+    tag = payload.content.get("tag")
+    params = {"title": payload.title, "content": content, "enc": enc, "tag": tag if isinstance(tag, str) else None, "ts": ts}
+    async with rw_pool.connection() as conn:
+        if payload.id:
+            await conn.execute(SQL_UPDATE_NOTEBOOK, {**params, "id": payload.id})
+            nid = payload.id
+            action = "update"
+        else:
+            cur = await conn.execute(SQL_INSERT_NOTEBOOK, {**params, "owner": username})
+            nid = cur.lastrowid
+            action = "create"
+        await conn.commit()
+    audit_queue.put_nowait((nid, action, username, ts, orjson.dumps({"title": payload.title}).decode()))
     return {"id": nid, "status": "saved"}
 
 # --- Query runner (very restricted: only allows SELECT) ---
-SELECT_ONLY = re.compile(r"^\s*SELECT\s", re.IGNORECASE | re.DOTALL)
+# results are paged server-side and read from the cursor in fixed-size chunks
+MAX_QUERY_ROWS = 10_000
+QUERY_FETCH_SIZE = 1000
 
 class QueryRequest(BaseModel):
     query: str
+    limit: int = Field(1000, ge=1, le=MAX_QUERY_ROWS)
+    offset: int = Field(0, ge=0)
+
+SQL_JSONB_TEXT = "SELECT CASE WHEN json_valid(?1, 8) THEN json(?1) END"
+
+async def render_blob(conn, value: bytes) -> str:
+    """Make a BLOB cell JSON-safe: compressed notebook content and JSONB go back to
+    JSON text, anything else to base64."""
+    if value.startswith(zstd.FRAME_HEADER):
+        try:
+            return _zstd_decompressor.decompress(value).decode()
+        except (zstd.ZstdError, UnicodeDecodeError):
+            pass
+    if JSON_STORE == "jsonb":
+        cur = await conn.execute(SQL_JSONB_TEXT, (value,))
+        text = (await cur.fetchone())[0]
+        if text is not None:
+            return text
+    return base64.b64encode(value).decode()
 
 @app.post("/query")
 async def run_query(q: QueryRequest):
+    # read-only is enforced by ro_pool's authorizer; anything but a read fails to prepare
+    # The statement runs exactly as written (no wrapping subquery), so column names are
+    # what SQLite reports for it, duplicates included, and trailing ";"/comments are left
+    # to sqlite3. Paging happens on the cursor instead: skip `offset` rows, then read
+    # limit + 1 rows (the extra one tells the client whether another page exists).
     sql = q.query.strip()
-    if not SELECT_ONLY.match(sql):
-        raise HTTPException(status_code=400, detail="Only SELECT queries are allowed in demo.")
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    try:
-        cur.execute(sql)
-        cols = [d[0] for d in cur.description] if cur.description else []
-        rows = cur.fetchall()
-        # Convert to simple list of dicts
-        results = [dict(zip(cols, row)) for row in rows]
-    except Exception as e:
-        conn.close()
-        raise HTTPException(status_code=400, detail=f"Query error: {str(e)}")
-    conn.close()
-    return {"columns": cols, "rows": results}
+    skip, want = q.offset, q.limit + 1
+    results = []
+    async with ro_pool.connection() as conn:
+        try:
+            cur = await conn.execute(sql)
+            cols = [d[0] for d in cur.description] if cur.description else []
+            while len(results) < want and (rows := await cur.fetchmany(QUERY_FETCH_SIZE)):
+                if skip:
+                    dropped = min(skip, len(rows))
+                    rows, skip = rows[dropped:], skip - dropped
+                # Convert to simple list of dicts; raw bytes would not survive JSON encoding
+                for row in rows[:want - len(results)]:
+                    if any(isinstance(v, bytes) for v in row):
+                        row = [await render_blob(conn, v) if isinstance(v, bytes) else v for v in row]
+                    results.append(dict(zip(cols, row)))
+            await cur.close()
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Query error: {str(e)}")
+    has_more = len(results) > q.limit
+    del results[q.limit:]
+    return json_response({"columns": cols, "rows": results, "limit": q.limit, "offset": q.offset, "has_more": has_more})
 
 # --- Socket.IO realtime handlers ---
 @sio.event
@@ -206,11 +419,12 @@ async def connect(sid, environ):
 @sio.event
 async def disconnect(sid):
     print("Disconnected:", sid)
-    # remove sid from ROOMs
-    for room, sids in list(ROOMS.items()):
-        if sid in sids:
-            sids.remove(sid)
-            await sio.emit("presence", {"room": room, "count": len(sids)}, room=room)
+    # sio.rooms() scans every room in the namespace (python-socketio keeps no per-sid
+    # index), so this is still O(rooms); sid is a member until the handler returns,
+    # so leave it out of the counts
+    for room in sio.rooms(sid):
+        if room != sid:
+            await sio.emit("presence", {"room": room, "count": room_count(room, exclude=sid)}, room=room)
 
 @sio.event
 async def join_room(sid, data):
@@ -219,9 +433,8 @@ async def join_room(sid, data):
     username = data.get("username", "anon")
     if room is None:
         return
-    sio.enter_room(sid, room)
-    ROOMS.setdefault(room, set()).add(sid)
-    await sio.emit("presence", {"room": room, "count": len(ROOMS[room])}, room=room)
+    await sio.enter_room(sid, room)
+    await sio.emit("presence", {"room": room, "count": room_count(room)}, room=room)
     await sio.emit("user_joined", {"username": username}, room=room)
 
 @sio.event
@@ -229,39 +442,78 @@ async def leave_room(sid, data):
     room = data.get("room")
     if room is None:
         return
-    sio.leave_room(sid, room)
-    if room in ROOMS and sid in ROOMS[room]:
-        ROOMS[room].remove(sid)
-    await sio.emit("presence", {"room": room, "count": len(ROOMS.get(room, []))}, room=room)
+    await sio.leave_room(sid, room)
+    await sio.emit("presence", {"room": room, "count": room_count(room)}, room=room)
+
+# Edits arriving within one flush window are flushed together once per room (~60 Hz).
+# PENDING[room] keeps arrival order as (sid, message) entries; an edit only merges into
+# the tail entry when the same sender made it, so cross-sender ordering is preserved
+PATCH_FLUSH_INTERVAL = 0.016
+PENDING: Dict[str, list[tuple[str | None, Dict[str, Any]]]] = {}
+TASKS: Dict[str, asyncio.Task] = {}
+
+def _merge_patch(pending: Dict[str, Any], patch: Dict[str, Any]):
+    # last writer wins on plain fields; op arrays are appended in arrival order
+    for key, value in patch.items():
+        if isinstance(value, list):
+            ops = pending.get(key)
+            if not isinstance(ops, list):
+                ops = pending[key] = []
+            ops.extend(value)
+        else:
+            pending[key] = value
+
+async def _flush(room: str):
+    await asyncio.sleep(PATCH_FLUSH_INTERVAL)
+    TASKS.pop(room, None)
+    for _, message in PENDING.pop(room, []):
+        await sio.emit("notebook_patch", message, room=room)
 
 @sio.event
 async def notebook_edit(sid, data):
     """
-    broadcast notebook edits to all clients in the room.
+    broadcast notebook edits to all clients in the room, coalesced per flush window.
     data := {"room": "<id>", "patch": {"cursor":..., "content": ...}, "username": "bob"}
     """
     room = data.get("room")
     if room:
-        # broadcast to room
-        await sio.emit("notebook_patch", data, room=room)
+        pending = PENDING.setdefault(room, [])
+        patch = data.get("patch")
+        if not isinstance(patch, dict):
+            # nothing to merge; queue as-is (sid None so later edits never merge into it)
+            pending.append((None, data))
+        else:
+            if not pending or pending[-1][0] != sid:
+                pending.append((sid, {"patch": {}}))
+            message = pending[-1][1]
+            message.update((k, v) for k, v in data.items() if k != "patch")
+            _merge_patch(message["patch"], patch)
+        if room not in TASKS:
+            TASKS[room] = asyncio.create_task(_flush(room))
 
 # --- Provide a simple endpoint that seeds demo tables to query ---
 @app.post("/seed-demo-data")
-async def seed_demo():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    # create a sample sales table
-    cur.execute("CREATE TABLE IF NOT EXISTS sales (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, country TEXT, product TEXT, amount REAL)")
-    cur.execute("DELETE FROM sales")  # reset for demo
-    demo_rows = [
-        ("2025-01-01","US","A", 120.50),
-        ("2025-01-02","US","B", 80.00),
-        ("2025-01-03","FR","A", 75.00),
-        ("2025-02-01","US","A", 200.00),
-        ("2025-02-05","FR","B", 150.00),
-        ("2025-03-01","MA","A", 50.00),
-    ]
-    cur.executemany("INSERT INTO sales (date, country, product, amount) VALUES (?,?,?,?)", demo_rows)
-    conn.commit()
-    conn.close()
-    return {"status": "seeded"}
+async def seed_demo(rows: int = Query(6, ge=1, le=10_000)):
+    async with rw_pool.connection() as conn:
+        # one write transaction for the whole reset, so it costs a single fsync
+        await conn.execute("BEGIN IMMEDIATE")
+        # create a sample sales table
+        await conn.execute("CREATE TABLE IF NOT EXISTS sales (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, country TEXT, product TEXT, amount REAL)")
+        await conn.execute("DELETE FROM sales")  # reset for demo
+        demo_rows = [
+            ("2025-01-01","US","A", 120.50),
+            ("2025-01-02","US","B", 80.00),
+            ("2025-01-03","FR","A", 75.00),
+            ("2025-02-01","US","A", 200.00),
+            ("2025-02-05","FR","B", 150.00),
+            ("2025-03-01","MA","A", 50.00),
+        ]
+        # deterministic filler rows beyond the fixed demo set, for larger benchmark tables
+        rng = random.Random(0)
+        demo_rows += [
+            (f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}", rng.choice(("US", "FR", "MA")), rng.choice("AB"), round(rng.uniform(10, 500), 2))
+            for _ in range(rows - len(demo_rows))
+        ]
+        await conn.executemany("INSERT INTO sales (date, country, product, amount) VALUES (?,?,?,?)", demo_rows[:rows])
+        await conn.commit()
+    return {"status": "seeded", "rows": rows}